@@ -4,71 +4,163 @@ import json
 import sys
 import time
 from importlib.metadata import version as packageVersion
-from typing import Any, Dict, Optional, Set
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
 
 import hid
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from .client import AstroA50Client
 
+_csvFieldnames = [
+    "timestamp",
+    "batteryChargePercent",
+    "batteryIsCharging",
+    "headsetIsDocked",
+    "headsetIsOn",
+    "sidetoneActivePercent",
+    "sidetoneSavedPercent"
+]
+
+SnapshotPrinter = Callable[[Dict[str, Any]], None]
+
+_minimumIntervalSeconds = 0.25
+_allowedFields: FrozenSet[str] = frozenset({"battery", "headset", "sidetone"})
+
+_deviceListCacheSeconds = 5.0
+_deviceListCache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+
+
 #*Helpers
-def _stableSignatureForChangeDetection(snapshot: Dict[str, Any]) -> str:
-    comparable = dict(snapshot)
-    comparable.pop("timestamp", None)
-    return json.dumps(comparable, sort_keys=True, separators=(",", ":"))
+def _enumerateVendorDevices(vendorId: int) -> List[Dict[str, Any]]:
+    cached = _deviceListCache.get(vendorId)
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+
+    #?Filter by vendor in hidapi itself, product 0 matches any
+    devices = hid.enumerate(vendorId, 0)
+    _deviceListCache[vendorId] = (time.monotonic() + _deviceListCacheSeconds, devices)
+    return devices
+
+
+def _signatureForChangeDetection(snapshot: Dict[str, Any]) -> Tuple[Any, ...]:
+    battery = snapshot.get("battery") or {}
+    headset = snapshot.get("headset") or {}
+    sidetone = snapshot.get("sidetone") or {}
+    return (
+        battery.get("chargePercent"),
+        battery.get("isCharging"),
+        headset.get("isDocked"),
+        headset.get("isOn"),
+        sidetone.get("activePercent"),
+        sidetone.get("savedPercent"),
+    )
+
+
+def _intervalSeconds(value: str) -> float:
+    try:
+        seconds = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number of seconds: {value!r}") from None
+
+    if seconds < _minimumIntervalSeconds:
+        raise argparse.ArgumentTypeError(f"must be at least {_minimumIntervalSeconds} seconds, got {value}")
+    return seconds
+
+
+#*Printers
+#?Built once from the CLI flags, so watch ticks don't re-check the output mode
+def _makeCsvPrinter(csvWriter: Any, includeTimestamp: bool, includeBattery: bool, includeHeadset: bool, includeSidetone: bool) -> SnapshotPrinter:
+    writeRow = csvWriter.writerow
+    flushOutput = sys.stdout.flush
+    emptyPair = (None, None)
+
+    def printCsv(snapshot: Dict[str, Any]) -> None:
+        #?Same order as _csvFieldnames
+        row: List[Any] = [snapshot["timestamp"] if includeTimestamp else None]
+
+        if includeBattery:
+            battery = snapshot["battery"]
+            row += (battery["chargePercent"], battery["isCharging"])
+        else:
+            row += emptyPair
 
+        if includeHeadset:
+            headset = snapshot["headset"]
+            row += (headset["isDocked"], headset["isOn"])
+        else:
+            row += emptyPair
 
-def _printSnapshot(snapshot: Dict[str, Any], asJson: bool, prettyJson: bool, asCsv: bool, csvWriter: Optional[csv.DictWriter]) -> None:
-    if asCsv:
-        row: Dict[str, Any] = {}
+        if includeSidetone:
+            sidetone = snapshot["sidetone"]
+            row += (sidetone["activePercent"], sidetone["savedPercent"])
+        else:
+            row += emptyPair
 
-        if "timestamp" in snapshot:
-            row["timestamp"] = snapshot["timestamp"]
+        writeRow(row)
+        flushOutput()
 
-        battery = snapshot.get("battery")
-        if isinstance(battery, dict):
-            row["batteryChargePercent"] = battery.get("chargePercent")
-            row["batteryIsCharging"] = battery.get("isCharging")
+    return printCsv
 
-        headset = snapshot.get("headset")
-        if isinstance(headset, dict):
-            row["headsetIsDocked"] = headset.get("isDocked")
-            row["headsetIsOn"] = headset.get("isOn")
 
-        sidetone = snapshot.get("sidetone")
-        if isinstance(sidetone, dict):
-            row["sidetoneActivePercent"] = sidetone.get("activePercent")
-            row["sidetoneSavedPercent"] = sidetone.get("savedPercent")
+def _makeJsonPrinter(prettyJson: bool) -> SnapshotPrinter:
+    if orjson is not None:
+        #?orjson gives bytes, so skip the text layer. Keep tty output live like print would
+        outputBuffer = sys.stdout.buffer
+        option = orjson.OPT_INDENT_2 if prettyJson else 0
+        flushEachLine = sys.stdout.line_buffering
 
-        if csvWriter is None:
-            raise RuntimeError("csvWriter is None in CSV mode")
+        def printOrjson(snapshot: Dict[str, Any]) -> None:
+            outputBuffer.write(orjson.dumps(snapshot, option=option))
+            outputBuffer.write(b"\n")
+            if flushEachLine:
+                outputBuffer.flush()
 
-        csvWriter.writerow(row)
-        sys.stdout.flush()
-        return
+        return printOrjson
 
-    if asJson:
-        if prettyJson:
-            print(json.dumps(snapshot, indent=2, sort_keys=True))
-        else:
-            print(json.dumps(snapshot, separators=(",", ":"), sort_keys=True))
-        return
+    writeOutput = sys.stdout.write
+
+    if prettyJson:
+        def printPrettyJson(snapshot: Dict[str, Any]) -> None:
+            writeOutput(json.dumps(snapshot, indent=2) + "\n")
 
-    #*Human Readable
-    battery = snapshot.get("battery")
-    if isinstance(battery, dict):
-        print(f"Battery: {battery.get('chargePercent')}% charging={battery.get('isCharging')}")
+        return printPrettyJson
 
-    headset = snapshot.get("headset")
-    if isinstance(headset, dict):
-        print(f"Headset: docked={headset.get('isDocked')} on={headset.get('isOn')}")
+    def printJson(snapshot: Dict[str, Any]) -> None:
+        writeOutput(json.dumps(snapshot, separators=(",", ":")) + "\n")
 
-    sidetone = snapshot.get("sidetone")
-    if isinstance(sidetone, dict):
-        print(f"Sidetone: active={sidetone.get('activePercent')}% saved={sidetone.get('savedPercent')}%")
+    return printJson
+
+
+def _makeTextPrinter(includeBattery: bool, includeHeadset: bool, includeSidetone: bool) -> SnapshotPrinter:
+    writeOutput = sys.stdout.write
+
+    def printText(snapshot: Dict[str, Any]) -> None:
+        #?One write per snapshot rather than one print per line
+        lines: List[str] = []
+
+        if includeBattery:
+            battery = snapshot["battery"]
+            lines.append(f"Battery: {battery['chargePercent']}% charging={battery['isCharging']}\n")
+
+        if includeHeadset:
+            headset = snapshot["headset"]
+            lines.append(f"Headset: docked={headset['isDocked']} on={headset['isOn']}\n")
+
+        if includeSidetone:
+            sidetone = snapshot["sidetone"]
+            lines.append(f"Sidetone: active={sidetone['activePercent']}% saved={sidetone['savedPercent']}%\n")
+
+        writeOutput("".join(lines))
+
+    return printText
 
 
 def _printDeviceList(vendorId: int) -> int:
-    devices = [d for d in hid.enumerate() if d.get("vendor_id") == vendorId]
+    devices = _enumerateVendorDevices(vendorId)
 
     if not devices:
         print(f"No HID devices found for vendor_id=0x{vendorId:04X}")
@@ -110,7 +202,9 @@ def main() -> int:
     #?Watch
     parser.add_argument("--watch", action="store_true")
     parser.add_argument("--changes-only", action="store_true")
-    parser.add_argument("--interval", type=float, default=2.0)
+    parser.add_argument("--interval", type=_intervalSeconds, default=2.0)
+    parser.add_argument("--min-interval", type=_intervalSeconds, default=None, help="Poll interval right after a change (default: --interval)")
+    parser.add_argument("--max-interval", type=_intervalSeconds, default=None, help="Longest poll interval while nothing changes (default: 8x --min-interval)")
     parser.add_argument("--count", type=int, default=0)
 
     args = parser.parse_args()
@@ -120,21 +214,20 @@ def main() -> int:
         print(packageVersion("hyperheadset"))
         return 0
 
-    vendorId = int(args.vendor_id)
+    vendorId = args.vendor_id
 
     if args.device_list:
         return _printDeviceList(vendorId)
 
-    if args.interval <= 0:
-        raise SystemExit("--interval must be > 0")
-
-    intervalSeconds = max(args.interval, 0.25)
-
-    allowedFields: Set[str] = {"battery", "headset", "sidetone"}
+    #?Watch backs off while nothing changes, then snaps back to the minimum
+    minIntervalSeconds = args.interval if args.min_interval is None else args.min_interval
+    maxIntervalSeconds = minIntervalSeconds * 8 if args.max_interval is None else args.max_interval
+    if maxIntervalSeconds < minIntervalSeconds:
+        raise SystemExit("--max-interval must be >= --min-interval")
 
     if args.fields.strip():
         requested = {x.strip().lower() for x in args.fields.split(",") if x.strip()}
-        unknown = requested - allowedFields
+        unknown = requested - _allowedFields
         if unknown:
             raise SystemExit(f"Unknown fields: {', '.join(sorted(unknown))}")
 
@@ -155,47 +248,63 @@ def main() -> int:
     prettyJson = bool(args.p)
     includeTimestamp = not args.no_timestamp
 
-    csvWriter: Optional[csv.DictWriter] = None
     if asCsv:
-        fieldnames = [
-            "timestamp",
-            "batteryChargePercent",
-            "batteryIsCharging",
-            "headsetIsDocked",
-            "headsetIsOn",
-            "sidetoneActivePercent",
-            "sidetoneSavedPercent"
-        ]
-        csvWriter = csv.DictWriter(sys.stdout, fieldnames=fieldnames)
-        csvWriter.writeheader()
-
-    lastSignature: Optional[str] = None
+        csvWriter = csv.writer(sys.stdout)
+        csvWriter.writerow(_csvFieldnames)
+        printer = _makeCsvPrinter(csvWriter, includeTimestamp, includeBattery, includeHeadset, includeSidetone)
+    elif asJson:
+        printer = _makeJsonPrinter(prettyJson)
+    else:
+        printer = _makeTextPrinter(includeBattery, includeHeadset, includeSidetone)
+
+    lastSignature: Optional[Tuple[Any, ...]] = None
 
     with AstroA50Client(vendorId=vendorId) as client:
 
-        def emitOnce() -> bool:
+        #?Everything the loop needs is bound as a default, so it's a fast local read on every tick
+        def emitOnce(
+            getSnapshot: Callable[..., Dict[str, Any]] = client.getSnapshot,
+            printer: SnapshotPrinter = printer,
+            detectChanges: bool = bool(args.watch and args.changes_only),
+            includeBattery: bool = includeBattery,
+            includeHeadset: bool = includeHeadset,
+            includeSidetone: bool = includeSidetone,
+            includeTimestamp: bool = includeTimestamp,
+        ) -> bool:
             nonlocal lastSignature
 
-            snapshot = client.getSnapshot(battery=includeBattery, headset=includeHeadset, sidetone=includeSidetone, includeTimestamp=includeTimestamp)
+            snapshot = getSnapshot(battery=includeBattery, headset=includeHeadset, sidetone=includeSidetone, includeTimestamp=includeTimestamp)
 
-            if args.watch and args.changes_only:
-                sig = _stableSignatureForChangeDetection(snapshot)
+            if detectChanges:
+                sig = _signatureForChangeDetection(snapshot)
                 if sig == lastSignature:
                     return False
                 lastSignature = sig
 
-            _printSnapshot(snapshot, asJson, prettyJson, asCsv, csvWriter)
+            printer(snapshot)
             return True
 
         if args.watch:
             emitted = 0
+            currentIntervalSeconds = minIntervalSeconds
+            #?Schedule against deadlines so the time spent querying doesn't add drift
+            nextTick = time.monotonic()
             try:
                 while True:
                     if emitOnce():
                         emitted += 1
                         if args.count and emitted >= args.count:
                             return 0
-                    time.sleep(intervalSeconds)
+                        currentIntervalSeconds = minIntervalSeconds
+                    else:
+                        currentIntervalSeconds = min(currentIntervalSeconds * 2, maxIntervalSeconds)
+
+                    nextTick += currentIntervalSeconds
+                    now = time.monotonic()
+                    if nextTick < now:
+                        #?Fell behind (slow device, suspend), don't burst to catch up
+                        nextTick = now
+                    time.sleep(nextTick - now)
             except KeyboardInterrupt:
                 if not asCsv:
                     print("\nStopped.")
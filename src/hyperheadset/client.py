@@ -1,58 +1,98 @@
+import functools
+import struct
 import time
-from typing import Any, Dict, Optional, Sequence
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
 
 import hid
 
 from .enums import Command, SliderType
 from .models import BatteryStatus, HeadsetStatus
 
+_devicePathCacheSeconds = 5.0
+_maxDrainedInputReports = 32
+
+#?Plain ints for the response checks, so each check is an int compare rather than an enum conversion
+_sliderValueCommandId = Command.getSliderValue.value
+_noiseGateModeCommandId = Command.getNoiseGateMode.value
+_noiseGateModeEcho = bytes((_noiseGateModeCommandId,))
+
+
+@functools.lru_cache(maxsize=64)
+def _cachedRequestFrame(commandId: int, payloadTuple: Tuple[int, ...], reportLength: int) -> bytes:
+    frameBytes = bytearray(reportLength)
+
+    #?65 byte reports carry a leading report id of 0x00
+    offset = 1 if reportLength == 65 else 0
+    frameBytes[offset] = 0x02
+    frameBytes[offset + 1] = commandId & 0xFF
+
+    if payloadTuple:
+        payloadLength = len(payloadTuple)
+        frameBytes[offset + 2] = payloadLength & 0xFF
+        frameBytes[offset + 3 : offset + 3 + payloadLength] = bytes(value & 0xFF for value in payloadTuple)
+
+    return bytes(frameBytes)
+
 
 class AstroA50Client:
     """
     Minimal HID client for Astro A50 base station.
+
+    The device is opened on first use and kept open until close() or the
+    end of a with block.
     """
 
     def __init__(self, vendorId: int = 0x9886, reportLengths: Sequence[int] = (64, 65), commandDelaySeconds: float = 0.08) -> None:
         self.vendorId = vendorId
-        self.reportLengths = tuple(int(value) for value in reportLengths)
-        self.commandDelaySeconds = float(commandDelaySeconds)
+        self.reportLengths = tuple(reportLengths)
+        self.commandDelaySeconds = commandDelaySeconds
         self.lastGoodBatteryStatus: Optional[BatteryStatus] = None
+        self._cachedDevicePath: Optional[bytes] = None
+        self._devicePathExpiry: float = 0.0
+        self._handle: Optional[Any] = None
+        self._inContext = False
+        self._settleDeadline: float = 0.0
+        self._knownGoodReportLength: Optional[int] = None
 
     def __enter__(self) -> "AstroA50Client":
+        #?The first query opens the device, so a flaky open gets _query's retries.
+        #?It then stays open until __exit__
+        self._inContext = True
         return self
 
     def __exit__(self, excType, exc, tb) -> bool:
-        #TODO not implemented, may do one day
+        self.close()
         return False
 
+    def close(self) -> None:
+        self._inContext = False
+        self._closeHandle()
+
     #?HID Helpers
     def _findDevicePath(self) -> bytes:
-        devices = [device for device in hid.enumerate() if device.get("vendor_id") == self.vendorId]
+        if self._cachedDevicePath is not None and time.monotonic() < self._devicePathExpiry:
+            return self._cachedDevicePath
+
+        #?Filter by vendor in hidapi itself, product 0 matches any
+        devices = hid.enumerate(self.vendorId, 0)
         if not devices:
             raise RuntimeError("Astro A50 HID interface not found (driver should be 'USB Input Device').")
-        return devices[0]["path"]
-
-    def _buildRequestFrame(self, commandId: int, payloadBytes: Optional[Sequence[int]], reportLength: int) -> bytes:
-        
-        frameBytes = [0x02, commandId & 0xFF, 0x00]
 
-        if payloadBytes:
-            frameBytes[2] = len(payloadBytes) & 0xFF
-            frameBytes.extend([(value & 0xFF) for value in payloadBytes])
+        self._cachedDevicePath = devices[0]["path"]
+        self._devicePathExpiry = time.monotonic() + _devicePathCacheSeconds
+        return self._cachedDevicePath
 
-        if reportLength == 65:
-            paddedBody = frameBytes + [0] * (64 - len(frameBytes))
-            return bytes([0x00]) + bytes(paddedBody)
-
-        paddedBody = frameBytes + [0] * (reportLength - len(frameBytes))
-        return bytes(paddedBody)
+    def _invalidateDevicePath(self) -> None:
+        self._cachedDevicePath = None
+        self._devicePathExpiry = 0.0
 
     def _normalizeResponseFrame(self, responseFrame: bytes) -> bytes:
         if (responseFrame and responseFrame[0] == 0x00 and len(responseFrame) > 1 and responseFrame[1] == 0x02):
             return responseFrame[1:]
         return responseFrame
 
-    def _extractPayload(self, responseFrame: bytes) -> Optional[bytes]:
+    def _extractPayload(self, responseFrame: bytes) -> Optional[memoryview]:
         if len(responseFrame) < 3:
             return None
 
@@ -64,53 +104,133 @@ class AstroA50Client:
 
         payloadLength = responseFrame[2]
         payloadLength = min(payloadLength, max(0, len(responseFrame) - 3))
-        return responseFrame[3 : 3 + payloadLength]
-
-    def _sendCommandOnce(self, devicePath: bytes, commandId: int, payloadBytes: Optional[Sequence[int]]) -> Optional[bytes]:
-        for reportLength in self.reportLengths:
-            deviceHandle = hid.device()
-            try:
-                deviceHandle.open_path(devicePath)
-                deviceHandle.set_nonblocking(0)
-
-                requestFrame = self._buildRequestFrame(commandId, payloadBytes, reportLength)
+        #?View into the frame, no copy for the few bytes we actually parse
+        return memoryview(responseFrame)[3 : 3 + payloadLength]
+
+    def _openHandle(self) -> Any:
+        if self._handle is not None:
+            return self._handle
+
+        deviceHandle = hid.device()
+        try:
+            deviceHandle.open_path(self._findDevicePath())
+            deviceHandle.set_nonblocking(0)
+        except (OSError, RuntimeError):
+            #?Stale path, most likely a re-plug. Enumerate again next time
+            self._invalidateDevicePath()
+            raise
+
+        self._handle = deviceHandle
+        return deviceHandle
+
+    def _closeHandle(self) -> None:
+        if self._handle is None:
+            return
+        try:
+            self._handle.close()
+        except Exception:
+            pass
+        self._handle = None
+
+    @contextmanager
+    def _session(self) -> Iterator[None]:
+        #?Holds one handle across several queries. Inside a with block the handle belongs
+        #?to the client, so only a bare call closes it. The open is left to the first query
+        ownsHandle = not self._inContext
+        try:
+            yield
+        finally:
+            if ownsHandle:
+                self._closeHandle()
+
+    def _waitForSettle(self) -> None:
+        remainingSeconds = self._settleDeadline - time.monotonic()
+        if remainingSeconds > 0:
+            time.sleep(remainingSeconds)
+
+    def _reportLengthsToTry(self) -> Tuple[int, ...]:
+        #?The working length doesn't change for a device, so try the last good one first
+        knownGood = self._knownGoodReportLength
+        if knownGood is None:
+            return self.reportLengths
+        return (knownGood,) + tuple(length for length in self.reportLengths if length != knownGood)
+
+    def _drainInputReports(self, deviceHandle: Any, reportLength: int) -> None:
+        #?The handle stays open, so late replies and unsolicited reports queue up on it.
+        #?Drop them so the next read is the reply to our write. Bounded in case the device streams
+        deviceHandle.set_nonblocking(1)
+        try:
+            for _ in range(_maxDrainedInputReports):
+                if not deviceHandle.read(reportLength):
+                    break
+        finally:
+            deviceHandle.set_nonblocking(0)
+
+    def _sendCommandOnce(self, commandId: int, payloadBytes: Optional[Sequence[int]]) -> Optional[bytes]:
+        payloadTuple = tuple(payloadBytes or ())
+
+        for _ in range(2):
+            deviceHandle = self._openHandle()
+            hadDeviceError = False
+
+            for reportLength in self._reportLengthsToTry():
+                requestFrame = _cachedRequestFrame(commandId, payloadTuple, reportLength)
 
                 try:
                     deviceHandle.send_feature_report(requestFrame)
+                    #?Fixed wait on purpose: reading early can return the previous reply, and
+                    #?battery/headset payloads have no command echo to catch that with
                     time.sleep(0.03)
                     featureResponse = deviceHandle.get_feature_report(0, reportLength)
                     if featureResponse:
+                        self._knownGoodReportLength = reportLength
                         return self._normalizeResponseFrame(bytes(featureResponse))
                 except OSError:
-                    pass
+                    hadDeviceError = True
 
                 try:
+                    self._drainInputReports(deviceHandle, reportLength)
                     deviceHandle.write(requestFrame)
                     interruptResponse = deviceHandle.read(reportLength, timeout_ms=250)
                     if interruptResponse:
+                        self._knownGoodReportLength = reportLength
                         return self._normalizeResponseFrame(bytes(interruptResponse))
                 except OSError:
-                    pass
+                    hadDeviceError = True
 
-            finally:
-                try:
-                    deviceHandle.close()
-                except Exception:
-                    pass
+            #?Nothing worked, so the remembered length may be wrong now too
+            self._knownGoodReportLength = None
+
+            if not hadDeviceError:
+                return None
+
+            #?Handle may be dead (unplugged/replugged), reopen it once
+            self._closeHandle()
+            self._invalidateDevicePath()
 
         return None
 
-    def _query(self, commandId: int, payloadBytes: Optional[Sequence[int]] = None, retries: int = 4) -> bytes:
-        devicePath = self._findDevicePath()
+    def _query(self, commandId: int, payloadBytes: Optional[Sequence[int]] = None, retries: int = 4, postDelaySeconds: Optional[float] = None, responseEcho: Optional[bytes] = None) -> memoryview:
+        """
+        The settle delay after a good response is not slept here, it is
+        waited out before the next command so the last query is free.
+
+        responseEcho is the prefix a reply to this command must start with,
+        anything else is treated as a stale reply and retried.
+        """
+        if postDelaySeconds is None:
+            postDelaySeconds = self.commandDelaySeconds
+
         lastError: Optional[Exception] = None
 
         for _ in range(int(retries)):
+            self._waitForSettle()
             try:
-                responseFrame = self._sendCommandOnce(devicePath, int(commandId), payloadBytes)
+                responseFrame = self._sendCommandOnce(int(commandId), payloadBytes)
                 if responseFrame:
                     payloadFromDevice = self._extractPayload(responseFrame)
-                    if payloadFromDevice is not None:
-                        time.sleep(self.commandDelaySeconds)
+                    if payloadFromDevice is not None and (responseEcho is None or payloadFromDevice[: len(responseEcho)] == responseEcho):
+                        self._settleDeadline = time.monotonic() + postDelaySeconds
                         return payloadFromDevice
             except Exception as error:
                 lastError = error
@@ -131,7 +251,7 @@ class AstroA50Client:
 
             if len(payloadBytes) >= 1:
                 statusByte = payloadBytes[0]
-                batteryStatus = BatteryStatus(isCharging=bool(statusByte & 0x80), chargePercent=int(statusByte & 0x7F))
+                batteryStatus = BatteryStatus(isCharging=statusByte >= 0x80, chargePercent=statusByte & 0x7F)
 
                 if 0 <= batteryStatus.chargePercent <= 100:
                     self.lastGoodBatteryStatus = batteryStatus
@@ -147,7 +267,7 @@ class AstroA50Client:
     def getHeadsetStatus(self) -> HeadsetStatus:
         payloadBytes = self._query(Command.getHeadsetStatus)
         if len(payloadBytes) < 1:
-            raise RuntimeError(f"Unexpected headset status payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected headset status payload: {bytes(payloadBytes)!r}")
 
         statusByte = payloadBytes[0]
         return HeadsetStatus(isDocked=bool(statusByte & 0x01), isOn=bool(statusByte & 0x02))
@@ -157,73 +277,88 @@ class AstroA50Client:
         Expects payload like:
           [0x68, sliderType, activeValue, savedValue]
         """
+        activeValue, savedValue = self.getSliderPair(sliderType)
+        return savedValue if saved else activeValue
+
+    def getSliderPair(self, sliderType: int | SliderType) -> Tuple[int, int]:
+        """
+        Returns (activeValue, savedValue) from a single slider query.
+        """
         sliderId = int(sliderType) & 0xFF
-        payloadBytes = self._query(Command.getSliderValue, [sliderId])
+        payloadBytes = self._query(Command.getSliderValue, [sliderId], responseEcho=bytes((_sliderValueCommandId, sliderId)))
+
+        if len(payloadBytes) < 4:
+            raise RuntimeError(f"Unexpected slider payload: {bytes(payloadBytes)!r}")
 
-        if (len(payloadBytes) < 4 or payloadBytes[0] != int(Command.getSliderValue) or payloadBytes[1] != sliderId):
-            raise RuntimeError(f"Unexpected slider payload: {payloadBytes!r}")
+        commandByte, responseSliderId, activeValue, savedValue = struct.unpack_from("BBBB", payloadBytes)
+        if commandByte != _sliderValueCommandId or responseSliderId != sliderId:
+            raise RuntimeError(f"Unexpected slider payload: {bytes(payloadBytes)!r}")
 
-        valueIndex = 2 + int(saved)
-        return int(payloadBytes[valueIndex])
+        return activeValue, savedValue
 
     def getActiveEqPreset(self) -> int:
         payloadBytes = self._query(Command.getActiveEqPreset)
         if not payloadBytes:
-            raise RuntimeError(f"Unexpected EQ payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected EQ payload: {bytes(payloadBytes)!r}")
         return int(payloadBytes[0])
 
     def getBalance(self) -> int:
         payloadBytes = self._query(Command.getBalance)
         if not payloadBytes:
-            raise RuntimeError(f"Unexpected balance payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected balance payload: {bytes(payloadBytes)!r}")
         return int(payloadBytes[0])
 
     def getDefaultBalance(self, saved: bool = False) -> int:
         payloadBytes = self._query(Command.getDefaultBalance, [int(saved)])
         if not payloadBytes:
-            raise RuntimeError(f"Unexpected default balance payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected default balance payload: {bytes(payloadBytes)!r}")
         return int(payloadBytes[0])
 
     def getAlertVolume(self, saved: bool = False) -> int:
         payloadBytes = self._query(Command.getAlertVolume, [int(saved)])
         if not payloadBytes:
-            raise RuntimeError(f"Unexpected alert volume payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected alert volume payload: {bytes(payloadBytes)!r}")
         return int(payloadBytes[0])
 
     def getMicEq(self, saved: bool = False) -> int:
         payloadBytes = self._query(Command.getMicEq, [int(saved)])
         if not payloadBytes:
-            raise RuntimeError(f"Unexpected mic EQ payload: {payloadBytes!r}")
+            raise RuntimeError(f"Unexpected mic EQ payload: {bytes(payloadBytes)!r}")
         return int(payloadBytes[0])
 
     def getNoiseGateMode(self, saved: bool = False) -> int:
         """
         Payload like: [0x6A, activeMode, savedMode]
         """
-        payloadBytes = self._query(Command.getNoiseGateMode)
+        payloadBytes = self._query(Command.getNoiseGateMode, responseEcho=_noiseGateModeEcho)
+
+        if len(payloadBytes) < 3:
+            raise RuntimeError(f"Unexpected noise gate payload: {bytes(payloadBytes)!r}")
 
-        if len(payloadBytes) < 3 or payloadBytes[0] != int(Command.getNoiseGateMode):
-            raise RuntimeError(f"Unexpected noise gate payload: {payloadBytes!r}")
+        commandByte, activeMode, savedMode = struct.unpack_from("BBB", payloadBytes)
+        if commandByte != _noiseGateModeCommandId:
+            raise RuntimeError(f"Unexpected noise gate payload: {bytes(payloadBytes)!r}")
 
-        return int(payloadBytes[1 + int(saved)])
+        return savedMode if saved else activeMode
 
     def getSnapshot(self, battery: bool = True, headset: bool = True, sidetone: bool = False, includeTimestamp: bool = True) -> Dict[str, Any]:
+        #?Key order here is the output order, the CLI does not sort keys
         snapshot: Dict[str, Any] = {}
 
         if includeTimestamp:
             snapshot["timestamp"] = time.time()
 
-        if battery:
-            batteryStatus = self.getBatteryStatus()
-            snapshot["battery"] = {"isCharging": batteryStatus.isCharging, "chargePercent": batteryStatus.chargePercent}
+        with self._session():
+            if battery:
+                batteryStatus = self.getBatteryStatus()
+                snapshot["battery"] = {"chargePercent": batteryStatus.chargePercent, "isCharging": batteryStatus.isCharging}
 
-        if headset:
-            headsetStatus = self.getHeadsetStatus()
-            snapshot["headset"] = {"isDocked": headsetStatus.isDocked, "isOn": headsetStatus.isOn}
+            if headset:
+                headsetStatus = self.getHeadsetStatus()
+                snapshot["headset"] = {"isDocked": headsetStatus.isDocked, "isOn": headsetStatus.isOn}
 
-        if sidetone:
-            sidetoneActive = self.getSliderValue(SliderType.sidetone, saved=False)
-            sidetoneSaved = self.getSliderValue(SliderType.sidetone, saved=True)
-            snapshot["sidetone"] = {"activePercent": int(sidetoneActive), "savedPercent": int(sidetoneSaved)}
+            if sidetone:
+                sidetoneActive, sidetoneSaved = self.getSliderPair(SliderType.sidetone)
+                snapshot["sidetone"] = {"activePercent": sidetoneActive, "savedPercent": sidetoneSaved}
 
         return snapshot
@@ -1,13 +1,13 @@
 from dataclasses import dataclass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BatteryStatus:
     isCharging: bool
     chargePercent: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class HeadsetStatus:
     isDocked: bool
     isOn: bool